@@ -18,7 +18,7 @@ sudo apt-get install -y \
 
 # Install Python packages
 echo "🐍 Installing Python packages..."
-pip3 install requests google-api-python-client google-auth-httplib2 google-auth-oauthlib
+pip3 install aiohttp orjson google-api-python-client google-auth-httplib2 google-auth-oauthlib
 
 # Create necessary directories
 mkdir -p /workspace/downloads
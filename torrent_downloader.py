@@ -5,20 +5,56 @@ Optimized for workspace environment
 """
 
 import os
-import sys
 import time
+import asyncio
 import base64
+import hashlib
+import mmap
 import subprocess
-import threading
-import queue
+import tempfile
 import shutil
-import requests
-import json
-import socket
-import re
-from typing import List, Optional, Dict, Any
+import orjson
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, Optional, Dict, Tuple
+
+if TYPE_CHECKING:
+    import aiohttp
+
+def _aiohttp():
+    """Import aiohttp on first use so the dependency check doesn't wait on it"""
+    import aiohttp
+    return aiohttp
 
 class CodespaceTorrentDownloader:
+    # Trackers that work in cloud environments
+    _TRACKERS = (
+        # Most reliable for cloud VPS
+        "udp://tracker.opentrackr.org:1337",
+        "udp://open.stealth.si:80",
+        "udp://tracker.torrent.eu.org:451",
+        "https://tracker.foreverpirates.co:443/announce",
+        "http://tracker.openbittorrent.com:80/announce",
+        # WebSocket trackers (often work better)
+        "wss://tracker.btorrent.xyz",
+        "wss://tracker.openwebtorrent.com",
+    )
+    _TRACKERS_JOINED = ",".join(_TRACKERS)
+
+    _BYTE_UNITS = ("B", "KB", "MB", "GB", "TB")
+
+    # Static part of every JSON-RPC request
+    _RPC_ENVELOPE = {"jsonrpc": "2.0", "id": "codespace"}
+
+    # Files worth extracting subtitles from
+    _VIDEO_EXTS = frozenset({".mkv", ".mp4", ".avi", ".mov", ".m4v", ".webm"})
+    # Language tags treated as French subtitles
+    _SUBTITLE_LANGS = frozenset({"fre", "fra", "fr", "french"})
+    # Text subtitle codecs stream-copied into their native file format,
+    # other text codecs are converted to SRT
+    _SUBTITLE_COPY_EXTS = {"subrip": "srt", "ass": "ass", "ssa": "ass", "webvtt": "vtt"}
+    # Image-based subtitles can't be written as text and would fail the whole run
+    _BITMAP_SUBTITLE_CODECS = frozenset({"hdmv_pgs_subtitle", "dvd_subtitle", "dvb_subtitle", "xsub"})
+
     def __init__(self):
         # Codespaces-specific paths
         self.WORKSPACE_DIR = "/workspace"
@@ -30,10 +66,23 @@ class CodespaceTorrentDownloader:
         self.ARIA2_PORT = 6800
         self.aria2_url = f"http://localhost:{self.ARIA2_PORT}/jsonrpc"
         self.aria2_proc = None
+        self._session: Optional[aiohttp.ClientSession] = None
         
-        # Threading
-        self.print_lock = threading.Lock()
-        self.task_queue = queue.Queue()
+        # aria2 WebSocket notifications, one event per watched GID
+        self._ws: Optional[aiohttp.ClientWebSocketResponse] = None
+        self._ws_task: Optional[asyncio.Task] = None
+        self._events: Dict[str, asyncio.Event] = {}
+        
+        # Keep in step with aria2's --max-concurrent-downloads
+        self.MAX_CONCURRENT_DOWNLOADS = 3
+        self._download_slots = asyncio.Semaphore(self.MAX_CONCURRENT_DOWNLOADS)
+        # Downloads currently printing progress
+        self._active_monitors = 0
+        # One ffmpeg job per core across all finished downloads
+        self._processing_slots = asyncio.Semaphore(os.cpu_count() or 1)
+        
+        # Torrent file lists already fetched from aria2, keyed by .torrent SHA1
+        self._torrent_files: Dict[str, List[Dict]] = {}
         
         self.setup_environment()
 
@@ -65,27 +114,23 @@ class CodespaceTorrentDownloader:
             except:
                 print(f"  ❌ {tool} not available")
 
-    def get_optimized_trackers(self) -> List[str]:
-        """Get trackers that work in cloud environments"""
-        return [
-            # Most reliable for cloud VPS
-            "udp://tracker.opentrackr.org:1337",
-            "udp://open.stealth.si:80", 
-            "udp://tracker.torrent.eu.org:451",
-            "https://tracker.foreverpirates.co:443/announce",
-            "http://tracker.openbittorrent.com:80/announce",
-            # WebSocket trackers (often work better)
-            "wss://tracker.btorrent.xyz",
-            "wss://tracker.openwebtorrent.com",
-        ]
+    async def setup(self):
+        """Create the shared HTTP session used for all RPC calls"""
+        aiohttp = _aiohttp()
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=32, keepalive_timeout=60),
+            timeout=aiohttp.ClientTimeout(total=15),
+            # aria2 sets no cookies, skip jar bookkeeping on every request
+            cookie_jar=aiohttp.DummyCookieJar()
+        )
 
-    def start_aria2_rpc(self):
+    async def start_aria2_rpc(self):
         """Start aria2 RPC server optimized for Codespaces"""
         print("🔄 Starting aria2 RPC server...")
         
         # Kill any existing processes
-        subprocess.run(["pkill", "-f", "aria2c"], capture_output=True)
-        time.sleep(2)
+        await self.run_command(["pkill", "-f", "aria2c"], timeout=10)
+        await asyncio.sleep(2)
         
         cmd = [
             "aria2c",
@@ -95,12 +140,13 @@ class CodespaceTorrentDownloader:
             "--rpc-allow-origin-all=true",
             "--dir", self.DOWNLOAD_DIR,
             "--continue=true",
-            "--max-concurrent-downloads=3",
+            f"--max-concurrent-downloads={self.MAX_CONCURRENT_DOWNLOADS}",
             "--max-connection-per-server=16",
             "--split=16",
             "--min-split-size=1M",
             "--seed-ratio=0.0",
             "--max-upload-limit=1K",
+            f"--bt-tracker={self._TRACKERS_JOINED}",
             "--bt-tracker-connect-timeout=10",
             "--bt-tracker-timeout=10",
             "--follow-torrent=mem",
@@ -112,26 +158,26 @@ class CodespaceTorrentDownloader:
         ]
         
         try:
-            self.aria2_proc = subprocess.Popen(
-                cmd, 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE,
-                text=True
+            # Output is never read, a pipe would only fill up and stall aria2c
+            self.aria2_proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL
             )
             
             # Wait for RPC to be ready
             for i in range(30):
                 try:
-                    response = requests.post(
+                    async with self._session.post(
                         self.aria2_url,
                         json={"jsonrpc": "2.0", "method": "aria2.getVersion", "id": "test"},
-                        timeout=2
-                    )
-                    if response.status_code == 200:
-                        print("✅ aria2 RPC server ready!")
-                        return True
-                except:
-                    time.sleep(1)
+                        timeout=_aiohttp().ClientTimeout(total=2)
+                    ) as response:
+                        if response.status == 200:
+                            print("✅ aria2 RPC server ready!")
+                            return True
+                except (_aiohttp().ClientError, asyncio.TimeoutError):
+                    await asyncio.sleep(1)
             
             print("❌ aria2 RPC failed to start")
             return False
@@ -140,70 +186,108 @@ class CodespaceTorrentDownloader:
             print(f"❌ Failed to start aria2: {e}")
             return False
 
-    def aria2_call(self, method: str, params: List = None, retries: int = 3) -> Optional[Dict]:
+    async def start_notifications(self) -> bool:
+        """Subscribe to aria2 download events over WebSocket"""
+        try:
+            self._ws = await self._session.ws_connect(self.aria2_url.replace("http", "ws", 1))
+        except (_aiohttp().ClientError, asyncio.TimeoutError) as e:
+            print(f"⚠️ aria2 notifications unavailable, falling back to polling: {e}")
+            return False
+        
+        self._ws_task = asyncio.create_task(self._dispatch_notifications())
+        return True
+
+    async def _dispatch_notifications(self):
+        """Wake the watchers of every GID aria2 reports an event for"""
+        text = _aiohttp().WSMsgType.TEXT
+        async for msg in self._ws:
+            if msg.type != text:
+                continue
+            data = orjson.loads(msg.data)
+            if not data.get("method", "").startswith("aria2.on"):
+                continue
+            for event_params in data.get("params", []):
+                event = self._events.get(event_params.get("gid"))
+                if event:
+                    event.set()
+
+    async def wait_for_event(self, gid: str, timeout: float, poll_interval: float) -> bool:
+        """Wait until aria2 notifies an event for gid, or timeout elapses"""
+        # Without a live notification channel nothing sets the event, poll instead
+        if self._ws_task is None or self._ws_task.done():
+            timeout = min(timeout, poll_interval)
+        event = self._events.setdefault(gid, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            event.clear()
+
+    async def aria2_call(self, method: str, params: List = None, retries: int = 3) -> Optional[Dict]:
         """Make RPC call with retries"""
         if params is None:
             params = []
             
-        payload = {
-            "jsonrpc": "2.0",
-            "method": method,
-            "id": "codespace",
-            "params": params
-        }
+        payload = dict(self._RPC_ENVELOPE, method=method, params=params)
         
         for attempt in range(retries):
             try:
-                response = requests.post(self.aria2_url, json=payload, timeout=15)
-                response.raise_for_status()
-                return response.json()
+                async with self._session.post(
+                    self.aria2_url,
+                    data=orjson.dumps(payload),
+                    headers={"Content-Type": "application/json"}
+                ) as response:
+                    response.raise_for_status()
+                    return orjson.loads(await response.read())
             except Exception as e:
                 if attempt == retries - 1:
                     print(f"❌ RPC call failed: {e}")
                     return None
-                time.sleep(1)
+                await asyncio.sleep(1)
         
         return None
 
-    def add_magnet_link(self, magnet_uri: str) -> Optional[str]:
+    async def add_magnet_link(self, magnet_uri: str) -> Optional[str]:
         """Add magnet link to download"""
-        trackers = self.get_optimized_trackers()
-        
-        options = {
-            "dir": self.DOWNLOAD_DIR,
-            "bt-tracker": ",".join(trackers),
-            "bt-tracker-connect-timeout": 10,
-            "bt-tracker-timeout": 10,
-            "max-upload-limit": "1K",
-            "seed-ratio": 0.0,
-            "follow-torrent": "mem",
-            "enable-dht": True,
-            "enable-peer-exchange": True
-        }
+        # Trackers and BitTorrent tuning are global aria2c options
+        options = {"dir": self.DOWNLOAD_DIR}
         
         try:
-            result = self.aria2_call("aria2.addUri", [[magnet_uri], options])
+            result = await self.aria2_call("aria2.addUri", [[magnet_uri], options])
             return result.get("result") if result else None
         except Exception as e:
             print(f"❌ Failed to add magnet: {e}")
             return None
 
-    def add_torrent_file(self, torrent_path: str, selected_files: List[int] = None) -> Optional[str]:
+    async def add_torrent_file(self, torrent_path: str, selected_files: List[int] = None) -> Optional[str]:
         """Add torrent file with optional file selection"""
         try:
+            # Encode straight from a read-only mapping to avoid an extra copy of the file
             with open(torrent_path, "rb") as f:
-                torrent_data = base64.b64encode(f.read()).decode()
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    torrent_data = base64.b64encode(mm).decode("ascii")
+            
+            # Known file list: select up front instead of pausing to fetch metadata
+            known_files = self._torrent_files.get(self._torrent_digest(torrent_path)) if selected_files else None
             
             options = {
                 "dir": self.DOWNLOAD_DIR,
-                "pause": "true" if selected_files else "false"
+                "pause": "true" if selected_files and not known_files else "false"
             }
+            if known_files:
+                indexes = self._select_file_indexes(selected_files, len(known_files))
+                if indexes:
+                    options["select-file"] = ",".join(map(str, indexes))
+                else:
+                    print("⚠️ No valid file numbers selected, downloading all")
             
-            result = self.aria2_call("aria2.addTorrent", [torrent_data, [], options])
+            result = await self.aria2_call("aria2.addTorrent", [torrent_data, [], options])
             gid = result.get("result") if result else None
             
-            if gid and selected_files:
-                self.apply_file_selection(gid, selected_files)
+            if gid and selected_files and not known_files:
+                await self.apply_file_selection(gid, selected_files)
                 
             return gid
             
@@ -211,51 +295,91 @@ class CodespaceTorrentDownloader:
             print(f"❌ Failed to add torrent: {e}")
             return None
 
-    def apply_file_selection(self, gid: str, selected_files: List[int]):
+    @staticmethod
+    @lru_cache(maxsize=64)
+    def _torrent_digest(torrent_path: str) -> str:
+        """SHA1 of a .torrent file"""
+        with open(torrent_path, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return hashlib.sha1(mm).hexdigest()
+
+    @staticmethod
+    def _select_file_indexes(selected_files: List[int], file_count: int) -> List[int]:
+        """aria2's 1-based select-file indexes, dropping out-of-range selections"""
+        return [i + 1 for i in sorted(set(selected_files)) if 0 <= i < file_count]
+
+    async def apply_file_selection(self, gid: str, selected_files: List[int]):
         """Apply file selection to torrent"""
         print("📁 Applying file selection...")
         
         # Wait for metadata
-        files = self.get_torrent_files(gid)
+        files = await self.get_torrent_files(gid)
         if not files:
             print("⚠️ Could not get file list, downloading all")
-            self.aria2_call("aria2.unpause", [gid])
+            await self.aria2_call("aria2.unpause", [gid])
+            return
+        
+        indexes = self._select_file_indexes(selected_files, len(files))
+        if not indexes:
+            print("⚠️ No valid file numbers selected, downloading all")
+            await self.aria2_call("aria2.unpause", [gid])
             return
         
-        # Select files
-        for i in range(len(files)):
-            select = (i in selected_files)
-            self.aria2_call("aria2.selectFile", [gid, i, select])
+        # Select files and resume in a single round-trip
+        select = ",".join(map(str, indexes))
+        await self.aria2_call("system.multicall", [[
+            {"methodName": "aria2.changeOption", "params": [gid, {"select-file": select}]},
+            {"methodName": "aria2.unpause", "params": [gid]}
+        ]])
         
-        print(f"✅ Selected {len(selected_files)} files")
-        self.aria2_call("aria2.unpause", [gid])
+        print(f"✅ Selected {len(indexes)} files")
 
-    def get_torrent_files(self, gid: str, timeout: int = 15) -> List[Dict]:
-        """Get torrent file list"""
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            result = self.aria2_call("aria2.tellStatus", [gid, ["files"]])
-            if result and "result" in result:
-                files = result["result"].get("files", [])
-                if files:
-                    return files
-            time.sleep(1)
-        return []
+    async def get_torrent_files(self, gid: str, timeout: int = 15) -> List[Dict]:
+        """Get torrent file list, waiting for aria2 to report its metadata"""
+        deadline = time.time() + timeout
+        self._events.setdefault(gid, asyncio.Event())
+        try:
+            while True:
+                result = await self.aria2_call("aria2.tellStatus", [gid, ["files", "bittorrent"]])
+                if result and "result" in result:
+                    status = result["result"]
+                    files = status.get("files", [])
+                    # Magnets list a placeholder file until bittorrent.info is known
+                    bittorrent = status.get("bittorrent")
+                    if files and (bittorrent is None or "info" in bittorrent):
+                        return files
+                
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return []
+                await self.wait_for_event(gid, remaining, poll_interval=1)
+        finally:
+            self._events.pop(gid, None)
 
-    def monitor_download(self, gid: str, name: str, timeout: int = 600) -> List[str]:
+    async def monitor_download(self, gid: str, name: str, timeout: int = 600) -> List[str]:
         """Monitor download progress"""
         print(f"⏳ Monitoring: {name}")
         
+        self._events.setdefault(gid, asyncio.Event())
+        self._active_monitors += 1
+        try:
+            return await self._watch_download(gid, name, timeout)
+        finally:
+            self._active_monitors -= 1
+            self._events.pop(gid, None)
+
+    async def _watch_download(self, gid: str, name: str, timeout: int) -> List[str]:
+        """Check status on every aria2 event for gid, or every 5 seconds for progress"""
         start_time = time.time()
         last_update = start_time
         
         while time.time() - start_time < timeout:
-            result = self.aria2_call("aria2.tellStatus", [
-                gid, ["status", "completedLength", "totalLength", "downloadSpeed", "files"]
+            result = await self.aria2_call("aria2.tellStatus", [
+                gid, ["status", "completedLength", "totalLength", "downloadSpeed"]
             ])
             
             if not result or "result" not in result:
-                time.sleep(2)
+                await self.wait_for_event(gid, 5, poll_interval=2)
                 continue
                 
             status = result["result"]
@@ -268,12 +392,19 @@ class CodespaceTorrentDownloader:
             if time.time() - last_update >= 5 and total > 0:
                 percent = (completed / total * 100) if total > 0 else 0
                 eta = (total - completed) // max(speed, 1) if speed > 0 else 0
-                print(f"\r📥 {name[:40]:40s} {percent:5.1f}% | {self.human_bytes(speed)}/s | ETA: {eta}s", end="")
+                progress = f"📥 {name[:40]:40s} {percent:5.1f}% | {self.human_bytes(speed)}/s | ETA: {eta}s"
+                # A single download redraws its line, concurrent ones would overwrite each other
+                if self._active_monitors > 1:
+                    print(progress)
+                else:
+                    print(f"\r{progress}", end="")
                 last_update = time.time()
             
             # Check completion
             if state == "complete":
-                files = status.get("files", [])
+                # The file list can be large, only fetch it once at the end
+                result = await self.aria2_call("aria2.tellStatus", [gid, ["files"]])
+                files = result.get("result", {}).get("files", []) if result else []
                 downloaded = []
                 for f in files:
                     path = f.get("path")
@@ -287,98 +418,216 @@ class CodespaceTorrentDownloader:
                 print(f"\n❌ Download failed: {name}")
                 return []
             
-            time.sleep(2)
+            await self.wait_for_event(gid, 5, poll_interval=2)
         
         print(f"\n⏰ Timeout: {name}")
         return []
 
-    def extract_subtitles(self, video_path: str) -> List[str]:
+    async def run_command(self, cmd: List[str], timeout: float) -> Tuple[int, bytes]:
+        """Run a command without blocking the event loop, killing it on timeout"""
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        try:
+            stdout, _ = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            raise
+        return proc.returncode, stdout
+
+    async def probe_subtitle_streams(self, video_path: str) -> List[Dict]:
+        """List subtitle streams with their codec and language tag"""
+        cmd = [
+            "ffprobe", "-v", "error", "-select_streams", "s",
+            "-show_entries", "stream=index,codec_name:stream_tags=language",
+            "-of", "json", video_path
+        ]
+        
+        try:
+            returncode, stdout = await self.run_command(cmd, timeout=30)
+            if returncode != 0:
+                return []
+            return orjson.loads(stdout).get("streams", [])
+        except Exception:
+            return []
+
+    async def extract_subtitles(self, video_path: str) -> List[str]:
         """Extract French subtitles"""
         if not os.path.exists(video_path):
             return []
             
         print(f"🎬 Extracting subtitles: {os.path.basename(video_path)}")
         
-        extracted = []
+        streams = [
+            stream for stream in await self.probe_subtitle_streams(video_path)
+            if stream.get("codec_name") not in self._BITMAP_SUBTITLE_CODECS
+        ]
+        if not streams:
+            print("  ⚠️ No subtitles found")
+            return []
+        
         base_name = os.path.splitext(video_path)[0]
-        languages = ["fre", "fra", "fr", "french"]
-        
-        for lang in languages:
-            output_file = f"{base_name}.{lang}.srt"
-            cmd = [
-                "ffmpeg", "-y", "-i", video_path,
-                "-map", f"0:s:m:language:{lang}",
-                output_file
-            ]
-            
-            try:
-                result = subprocess.run(cmd, capture_output=True, timeout=30, text=True)
-                if result.returncode == 0 and os.path.exists(output_file) and os.path.getsize(output_file) > 100:
-                    extracted.append(output_file)
-                    print(f"  ✅ Extracted {lang} subtitles")
-                    break
-            except:
-                continue
+        wanted = []
+        for stream in streams:
+            lang = stream.get("tags", {}).get("language", "").lower()
+            if lang in self._SUBTITLE_LANGS:
+                suffix = f".{stream['index']}" if wanted else ""
+                wanted.append((stream, f"{base_name}.{lang}{suffix}"))
+        
+        # Stub French tracks don't count
+        extracted = await self._dump_subtitles(video_path, wanted, min_size=100) if wanted else []
+        french = bool(extracted)
         
         # Fallback: any subtitle
         if not extracted:
-            output_file = f"{base_name}.srt"
-            cmd = ["ffmpeg", "-y", "-i", video_path, "-map", "0:s:0", output_file]
-            try:
-                result = subprocess.run(cmd, capture_output=True, timeout=30, text=True)
-                if result.returncode == 0 and os.path.exists(output_file):
-                    extracted.append(output_file)
-                    print("  ℹ️ Extracted first available subtitle")
-            except:
-                print("  ⚠️ No subtitles found")
+            extracted = await self._dump_subtitles(video_path, [(streams[0], base_name)])
+        
+        if not extracted:
+            print("  ⚠️ No subtitles found")
+        elif french:
+            print(f"  ✅ Extracted {len(extracted)} French subtitle track(s)")
+        else:
+            print("  ℹ️ Extracted first available subtitle")
+        
+        return extracted
+
+    async def _dump_subtitles(self, video_path: str, wanted: List[Tuple[Dict, str]],
+                              min_size: int = 0) -> List[str]:
+        """Write the wanted (stream, output stem) tracks, dropping failed or stub outputs"""
+        # ffmpeg writes to temporary names so files shipped with the torrent are never touched
+        temp_files = []
+        extracted = []
+        try:
+            # Dump every wanted track in a single pass over the container,
+            # copying packets as-is whenever the format allows it
+            cmd = ["ffmpeg", "-y", "-i", video_path]
+            for stream, stem in wanted:
+                ext = self._SUBTITLE_COPY_EXTS.get(stream.get("codec_name"))
+                codec = "copy" if ext else "srt"
+                fd, temp_file = tempfile.mkstemp(
+                    prefix=f"{os.path.basename(stem)}.", suffix=f".{ext or 'srt'}",
+                    dir=os.path.dirname(stem)
+                )
+                os.close(fd)
+                temp_files.append((temp_file, stem, ext or "srt"))
+                cmd += ["-map", f"0:{stream['index']}", "-c:s", codec, temp_file]
+            
+            returncode, _ = await self.run_command(cmd, timeout=30)
+            if returncode == 0:
+                for temp_file, stem, ext in temp_files:
+                    if os.path.getsize(temp_file) > min_size:
+                        output_file = self._unused_path(stem, ext)
+                        os.rename(temp_file, output_file)
+                        extracted.append(output_file)
+        except Exception:
+            pass
+        finally:
+            # Only ever remove what this run created
+            for temp_file, _, _ in temp_files:
+                if os.path.exists(temp_file):
+                    os.unlink(temp_file)
         
         return extracted
 
+    @staticmethod
+    def _unused_path(stem: str, ext: str) -> str:
+        """First of stem.ext, stem.1.ext, ... that doesn't exist yet"""
+        path = f"{stem}.{ext}"
+        n = 1
+        while os.path.exists(path):
+            path = f"{stem}.{n}.{ext}"
+            n += 1
+        return path
+
     def human_bytes(self, size: int) -> str:
         """Convert bytes to human readable format"""
-        for unit in ['B', 'KB', 'MB', 'GB']:
-            if size < 1024.0:
-                return f"{size:.2f}{unit}"
-            size /= 1024.0
-        return f"{size:.2f}TB"
-
-    def process_downloaded_files(self, files: List[str], name: str):
-        """Process downloaded files"""
+        # Every 10 bits of magnitude is one more 1024x unit
+        i = min((size.bit_length() - 1) // 10, 4) if size > 0 else 0
+        return f"{size / (1 << (10 * i)):.2f}{self._BYTE_UNITS[i]}"
+
+    def move_to_output(self, src: str):
+        """Move a file into the output directory"""
+        dst = os.path.join(self.OUTPUT_DIR, os.path.basename(src))
+        # rename and copyfile both replace dst, never clobber a finished file
+        if os.path.exists(dst):
+            raise shutil.Error(f"Destination path '{dst}' already exists")
+        
+        try:
+            os.rename(src, dst)
+        except OSError:
+            # Different filesystem: copyfile uses sendfile on Linux, no userspace copy
+            try:
+                shutil.copyfile(src, dst)
+            except OSError:
+                if os.path.exists(dst):
+                    os.unlink(dst)
+                raise
+            os.unlink(src)
+
+    async def process_downloaded_files(self, files: List[str], name: str) -> bool:
+        """Process downloaded files, returning whether every file succeeded"""
         print(f"🔄 Processing {len(files)} files for {name}")
         
-        for file_path in files:
-            if not os.path.exists(file_path):
-                continue
-                
+        # Videos first, so their subtitles are placed while sibling files are still here
+        videos = [f for f in files if os.path.splitext(f)[1].lower() in self._VIDEO_EXTS]
+        others = [f for f in files if os.path.splitext(f)[1].lower() not in self._VIDEO_EXTS]
+        
+        failed = 0
+        for batch in (videos, others):
+            results = await asyncio.gather(
+                *(self._process_file(file_path) for file_path in batch),
+                return_exceptions=True
+            )
+            for file_path, result in zip(batch, results):
+                if isinstance(result, BaseException):
+                    failed += 1
+                    print(f"❌ Failed to process {os.path.basename(file_path)}: {result}")
+        
+        if failed:
+            print(f"⚠️ Processed {name} with {failed} failed file(s)")
+            return False
+            
+        print(f"✅ Completed processing: {name}")
+        return True
+
+    async def _process_file(self, file_path: str):
+        """Extract subtitles from a downloaded file and move it to output"""
+        if not os.path.exists(file_path):
+            return
+        
+        async with self._processing_slots:
             file_size = os.path.getsize(file_path)
             print(f"📦 Processing: {os.path.basename(file_path)} ({self.human_bytes(file_size)})")
             
             # Extract subtitles for video files
-            if file_path.lower().endswith(('.mkv', '.mp4', '.avi', '.mov')):
-                subtitles = self.extract_subtitles(file_path)
+            if os.path.splitext(file_path)[1].lower() in self._VIDEO_EXTS:
+                subtitles = await self.extract_subtitles(file_path)
                 # Move subtitles to output
                 for sub in subtitles:
                     if os.path.exists(sub):
-                        shutil.move(sub, self.OUTPUT_DIR)
-            
-            # Move main file to output
-            shutil.move(file_path, self.OUTPUT_DIR)
+                        await asyncio.to_thread(self.move_to_output, sub)
             
-        print(f"✅ Completed processing: {name}")
+            # Move main file to output, off the loop since cross-device moves copy
+            await asyncio.to_thread(self.move_to_output, file_path)
 
-    def download_item(self, item: str, selected_files: List[int] = None) -> bool:
+    async def download_item(self, item: str, selected_files: List[int] = None) -> bool:
         """Download a single item"""
-        name = os.path.basename(item) if os.path.isfile(item) else item
+        is_magnet = item.startswith('magnet:')
+        is_file = not is_magnet and os.path.isfile(item)
+        name = os.path.basename(item) if is_file else item
         if len(name) > 50:
             name = name[:50]
         
         print(f"\n🎯 Starting download: {name}")
         
         try:
-            if os.path.isfile(item) and item.lower().endswith('.torrent'):
-                gid = self.add_torrent_file(item, selected_files)
-            elif item.startswith('magnet:'):
-                gid = self.add_magnet_link(item)
+            if is_magnet:
+                gid = await self.add_magnet_link(item)
+            elif is_file and item[-8:].lower() == ".torrent":
+                gid = await self.add_torrent_file(item, selected_files)
             else:
                 print(f"❌ Unsupported item: {item}")
                 return False
@@ -386,10 +635,9 @@ class CodespaceTorrentDownloader:
             if not gid:
                 return False
                 
-            downloaded_files = self.monitor_download(gid, name, 600)  # 10 minute timeout
+            downloaded_files = await self.monitor_download(gid, name, 600)  # 10 minute timeout
             if downloaded_files:
-                self.process_downloaded_files(downloaded_files, name)
-                return True
+                return await self.process_downloaded_files(downloaded_files, name)
             else:
                 return False
                 
@@ -397,16 +645,25 @@ class CodespaceTorrentDownloader:
             print(f"❌ Download failed: {e}")
             return False
 
-    def get_torrent_selection(self, torrent_path: str) -> List[int]:
+    async def download_items(self, items: List[str]) -> List[bool]:
+        """Download several items concurrently"""
+        async def bounded(item: str) -> bool:
+            async with self._download_slots:
+                return await self.download_item(item)
+        
+        return await asyncio.gather(*(bounded(item) for item in items))
+
+    async def get_torrent_selection(self, torrent_path: str) -> List[int]:
         """Interactive file selection for torrents"""
         try:
-            gid = self.add_torrent_file(torrent_path, [])
+            gid = await self.add_torrent_file(torrent_path, [])
             if not gid:
                 return []
                 
-            files = self.get_torrent_files(gid)
+            files = await self.get_torrent_files(gid)
             if not files:
                 return []
+            self._torrent_files[self._torrent_digest(torrent_path)] = files
             
             print(f"\n📁 Files in torrent:")
             for i, file_info in enumerate(files):
@@ -426,7 +683,7 @@ class CodespaceTorrentDownloader:
                     selected = list(range(len(files)))
             
             # Remove the temporary torrent
-            self.aria2_call("aria2.remove", [gid])
+            await self.aria2_call("aria2.remove", [gid])
             return selected
             
         except Exception as e:
@@ -451,20 +708,25 @@ class CodespaceTorrentDownloader:
             print(f"❌ File not found: {filename}")
             return None
 
-    def main(self):
+    async def main(self):
         """Main application"""
         print("=" * 60)
         print("🚀 GitHub Codespaces Torrent Downloader")
         print("=" * 60)
         
+        await self.setup()
+        
         # Start aria2
-        if not self.start_aria2_rpc():
+        if not await self.start_aria2_rpc():
             print("❌ Cannot continue without aria2")
+            await self._session.close()
             return
         
+        await self.start_notifications()
+        
         while True:
             print("\n📥 Options:")
-            print("1. Enter magnet link")
+            print("1. Enter magnet link(s)")
             print("2. Upload torrent file") 
             print("3. List downloaded files")
             print("4. Exit")
@@ -472,15 +734,15 @@ class CodespaceTorrentDownloader:
             choice = input("\nSelect option (1-4): ").strip()
             
             if choice == "1":
-                magnet = input("Enter magnet link: ").strip()
-                if magnet:
-                    self.download_item(magnet)
+                magnets = input("Enter magnet link(s), separated by spaces: ").split()
+                if magnets:
+                    await self.download_items(magnets)
                     
             elif choice == "2":
                 torrent_path = self.upload_torrent_file()
                 if torrent_path:
-                    selected = self.get_torrent_selection(torrent_path)
-                    self.download_item(torrent_path, selected)
+                    selected = await self.get_torrent_selection(torrent_path)
+                    await self.download_item(torrent_path, selected)
                     
             elif choice == "3":
                 self.list_downloaded_files()
@@ -491,31 +753,36 @@ class CodespaceTorrentDownloader:
             else:
                 print("❌ Invalid choice")
         
-        self.cleanup()
+        await self.cleanup()
 
     def list_downloaded_files(self):
         """List downloaded files"""
         print(f"\n📂 Downloaded files in {self.OUTPUT_DIR}:")
         try:
-            files = os.listdir(self.OUTPUT_DIR)
-            if files:
-                for file in sorted(files):
-                    path = os.path.join(self.OUTPUT_DIR, file)
-                    size = os.path.getsize(path)
-                    print(f"  📄 {file} ({self.human_bytes(size)})")
+            with os.scandir(self.OUTPUT_DIR) as it:
+                entries = sorted(it, key=lambda e: e.name)
+            if entries:
+                for entry in entries:
+                    print(f"  📄 {entry.name} ({self.human_bytes(entry.stat().st_size)})")
             else:
                 print("  No files downloaded yet")
         except Exception as e:
             print(f"  Error listing files: {e}")
 
-    def cleanup(self):
+    async def cleanup(self):
         """Cleanup resources"""
         print("\n🧹 Cleaning up...")
-        if self.aria2_proc:
+        if self._ws:
+            await self._ws.close()
+        if self._ws_task:
+            self._ws_task.cancel()
+        if self._session:
+            await self._session.close()
+        if self.aria2_proc and self.aria2_proc.returncode is None:
             self.aria2_proc.terminate()
-        subprocess.run(["pkill", "-f", "aria2c"], capture_output=True)
+        await self.run_command(["pkill", "-f", "aria2c"], timeout=10)
         print("✅ Cleanup complete")
 
 if __name__ == "__main__":
     downloader = CodespaceTorrentDownloader()
-    downloader.main()
+    asyncio.run(downloader.main())